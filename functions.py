@@ -1,12 +1,33 @@
 import os
+import atexit
+import re
+import json
+import time
+import hashlib
+import functools
+import random
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
+from diskcache import Cache
 from firecrawl import FirecrawlApp
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Tuple, Any
+from typing import Optional, List, Dict, Tuple, Any, Sequence, Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import logging
 
+try:
+    from orjson import loads as _json_loads
+except ImportError: # orjson is optional; stdlib json is a drop-in (slower) fallback
+    from json import loads as _json_loads
+
+try:
+    import ollama
+except ImportError: # Local LLM classification is optional; Firecrawl extract is used without it
+    ollama = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -14,130 +35,510 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 load_dotenv()
 SERPAPI_API_KEY = os.getenv('serpapi_api_key')
 FIRECRAWL_API_KEY = os.getenv('firecrawl_api_key')
+MAX_WORKERS = int(os.getenv('max_workers', '50')) # Default thread pool size for batch_* helpers
+LOCAL_LLM_MODEL = os.getenv('local_llm_model') # e.g. 'llama3.1:8b'; enables scrape-once + local Ollama classification
+LOCAL_LLM_MAX_CHARS = 20000 # Page markdown is truncated to this many characters before prompting the local model
+MEMO_MAXSIZE = 4096 # In-process memoization size for the per-URL assessment functions
+MAX_START_JITTER = 0.1 # Max random delay (seconds) before each pooled call, to avoid synchronized bursts
+
+# On-disk cache for paid API responses (SerpApi + Firecrawl), shared across runs
+_CACHE = Cache('.ia_cache')
+CACHE_TTL = 86400 # Seconds before a cached API response expires (1 day)
+
+RETRY_STATUSES = [429, 500, 502, 503, 504] # HTTP statuses treated as transient
+FIRECRAWL_MAX_ATTEMPTS = 3 # Attempts per Firecrawl extract call before giving up
+FIRECRAWL_RETRY_BACKOFF = 0.3 # Seconds; doubled after each failed attempt
+
+def build_http_session(pool_connections: int = 20, pool_maxsize: int = 50, backoff_factor: float = 0.3) -> requests.Session:
+    """
+    Creates a requests.Session with keep-alive connection pooling and retries (3 attempts with
+    exponential backoff on RETRY_STATUSES) for https:// URLs.
+    """
+    session = requests.Session()
+    session.headers.update({'Connection': 'keep-alive'})
+    session.mount('https://', HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(total=3, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES, allowed_methods=['GET']),
+    ))
+    return session
+
+# Default shared SerpApi session so keep-alive connections are reused across calls
+_SERP_SESSION = build_http_session()
+atexit.register(_SERP_SESSION.close)
+
+SERP_MAX_RESPONSE_BYTES = 2 * 1024 * 1024 # Cap on a SerpApi response body (2 MiB)
+# Leading scheme/slashes and trailing slashes, stripped from site paths in a single pass
+_SITE_RE = re.compile(r'^(?:https?://)?/*|/+$')
+
+# Shared Firecrawl SDK client, created once (None when no API key is configured)
+_FIRECRAWL = FirecrawlApp(api_key=FIRECRAWL_API_KEY) if FIRECRAWL_API_KEY else None
+MAX_EXTRACT_BATCH = 20 # Max URLs sent together in one multi-URL Firecrawl extract request
+
+
+def _parse_extract_response(url: str, response: Any) -> Optional[Dict]:
+    """Pulls the extracted 'data' out of a Firecrawl extract response, logging any problems."""
+    # Check response structure (can be dict for single URL or list for multiple)
+    response_data = None
+    if response and isinstance(response, list) and len(response) > 0:
+        response_data = response[0] # Handle list case (get first item)
+    elif response and isinstance(response, dict):
+         response_data = response # Handle dictionary case directly
+
+    if response_data:
+        if response_data.get('error'):
+             logging.error(f"Error from Firecrawl for URL {url}: {response_data['error']}")
+             return None
+        # Check if 'data' exists and is not None before returning
+        data = response_data.get('data')
+        if data:
+             logging.info(f"Firecrawl success for URL: {url}")
+             return data
+        else:
+             logging.warning(f"Firecrawl returned no 'data' for URL {url}. Response: {response_data}")
+             return None
+    else:
+         # Log the original response if it wasn't a recognized format
+        logging.warning(f"Unexpected or empty Firecrawl response format for URL {url}. Response: {response}")
+        return None
+
+
+def _extract_cache_key(url: str, prompt: str) -> str:
+    """Cache key for a Firecrawl extract call: a hash of the URL and the prompt."""
+    return 'extract:' + hashlib.blake2b(f"{url}|{prompt}".encode()).hexdigest()
+
+
+def _get_cached_extract(cache_key: str, url: str, validate: Callable[[str, Optional[Dict]], Optional[Dict]]) -> Optional[Dict]:
+    """Returns a previously cached Firecrawl extract result, or None on a cache miss or if it no longer validates."""
+    cached = _CACHE.get(cache_key)
+    if cached is None:
+        return None
+    logging.info(f"Firecrawl cache hit for URL: {url}")
+    return validate(url, _json_loads(cached))
+
+
+def _cache_extract(cache_key: str, data: Optional[Dict]) -> Optional[Dict]:
+    """Stores a validated Firecrawl extract result in the disk cache and passes it through."""
+    if data is not None: # Never cache failures or results that failed validation
+        _CACHE.set(cache_key, json.dumps(data), expire=CACHE_TTL)
+    return data
+
+
+def _is_transient_error(error: BaseException) -> bool:
+    """
+    True for timeouts, connection failures and retryable HTTP statuses. Walks the exception
+    chain because the Firecrawl SDK re-raises every failure as a plain ValueError.
+    """
+    while error is not None:
+        if isinstance(error, (TimeoutError, ConnectionError, requests.exceptions.ConnectionError,
+                              requests.exceptions.Timeout)):
+            return True
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+        if status in RETRY_STATUSES:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _with_retries(call, label: str) -> Any:
+    """Runs call(), retrying transient failures with exponential backoff; the last error is re-raised."""
+    for attempt in range(FIRECRAWL_MAX_ATTEMPTS):
+        try:
+            return call()
+        except Exception as e:
+            if attempt + 1 >= FIRECRAWL_MAX_ATTEMPTS or not _is_transient_error(e):
+                raise
+            delay = FIRECRAWL_RETRY_BACKOFF * 2 ** attempt
+            logging.warning(f"Transient Firecrawl error for URL {label} (attempt {attempt + 1}/{FIRECRAWL_MAX_ATTEMPTS}): {e}. Retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
+
+class _NoResult(Exception):
+    """Raised inside memoized calls so that failed (None) results are not cached."""
+
+
+def _memoize(func):
+    """
+    functools.lru_cache (maxsize MEMO_MAXSIZE) for the assessment functions that skips None
+    results, so a failed API call is retried next time instead of being remembered.
+    Cached dicts are shared between callers and must not be mutated.
+    """
+    @functools.lru_cache(maxsize=MEMO_MAXSIZE)
+    def cached(*args, **kwargs):
+        result = func(*args, **kwargs)
+        if result is None:
+            raise _NoResult # Exceptions are never cached by lru_cache
+        return result
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return cached(*args, **kwargs)
+        except _NoResult:
+            return None
+
+    wrapper.cache_clear = cached.cache_clear
+    wrapper.cache_info = cached.cache_info
+    return wrapper
+
+
+def _firecrawl_scrape(url: str) -> Optional[str]:
+    """Scrapes a page's main content as markdown via Firecrawl (disk-cached per URL), or None on failure."""
+    cache_key = f"scrape:{url}"
+    cached = _CACHE.get(cache_key)
+    if cached is not None:
+        logging.info(f"Firecrawl scrape cache hit for URL: {url}")
+        return cached
+    try:
+        logging.info(f"Scraping URL with Firecrawl: {url}")
+        data = _with_retries(lambda: _FIRECRAWL.scrape_url(url, params={'formats': ['markdown'], 'onlyMainContent': True}), url)
+        markdown = data.get('markdown') if isinstance(data, dict) else None
+        if not markdown:
+            logging.warning(f"Firecrawl scrape returned no markdown for URL {url}. Response: {data}")
+            return None
+        _CACHE.set(cache_key, markdown, expire=CACHE_TTL)
+        return markdown
+    except Exception as e:
+        logging.error(f"Error during Firecrawl scrape for URL {url}: {e}", exc_info=True)
+        return None
+
+
+def _local_llm_extract(url: str, prompt: str, schema: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    Runs an extract prompt against the page's scraped markdown with a local Ollama model.
+    Each page is scraped once and shared by every prompt run against it. Returns None when
+    the local model is not configured or fails, so the caller can fall back to Firecrawl extract.
+    """
+    if not LOCAL_LLM_MODEL or ollama is None:
+        return None
+    markdown = _firecrawl_scrape(url)
+    if markdown is None:
+        return None
+    try:
+        logging.info(f"Calling local LLM '{LOCAL_LLM_MODEL}' for URL: {url}")
+        response = ollama.chat(
+            model=LOCAL_LLM_MODEL,
+            messages=[{'role': 'user', 'content': f"{prompt}\n\nPage content ({url}):\n{markdown[:LOCAL_LLM_MAX_CHARS]}"}],
+            format=schema or 'json',
+        )
+        data = _json_loads(response['message']['content'])
+        if isinstance(data, dict) and data:
+            return data
+        logging.warning(f"Local LLM returned unexpected output for URL {url}: {data}")
+        return None
+    except Exception as e:
+        logging.warning(f"Local LLM call failed for URL {url}, falling back to Firecrawl extract: {e}")
+        return None
+
 
 # Helper function for Firecrawl calls to reduce repetition
-def _call_firecrawl_extract(url: str, prompt: str, schema: Optional[Dict] = None) -> Optional[Dict]:
-    """Helper function to call Firecrawl extract API."""
-    if not FIRECRAWL_API_KEY:
+def _call_firecrawl_extract(url: str, prompt: str, schema: Optional[Dict], validate: Callable[[str, Optional[Dict]], Optional[Dict]]) -> Optional[Dict]:
+    """
+    Helper function to call Firecrawl extract API. validate(url, data) returns the data if it has
+    the expected shape, else None; only validated results are cached.
+    """
+    if _FIRECRAWL is None:
         logging.error("Firecrawl API key not found.")
         return None
+    cache_key = _extract_cache_key(url, prompt)
+    cached = _get_cached_extract(cache_key, url, validate)
+    if cached is not None:
+        return cached
+    local_data = _local_llm_extract(url, prompt, schema)
+    if local_data is not None and validate(url, local_data) is not None:
+        return local_data
     try:
-        app = FirecrawlApp(api_key=FIRECRAWL_API_KEY)
         params = {'prompt': prompt}
         if schema:
             params['schema'] = schema
 
         logging.info(f"Calling Firecrawl for URL: {url}")
         # Make the API call (assuming extract takes a list of URLs)
-        response = app.extract([url], params=params) 
-
-        # Check response structure (can be dict for single URL or list for multiple)
-        response_data = None
-        if response and isinstance(response, list) and len(response) > 0:
-            response_data = response[0] # Handle list case (get first item)
-        elif response and isinstance(response, dict):
-             response_data = response # Handle dictionary case directly
-
-        if response_data:
-            if response_data.get('error'):
-                 logging.error(f"Error from Firecrawl for URL {url}: {response_data['error']}")
-                 return None
-            # Check if 'data' exists and is not None before returning
-            data = response_data.get('data')
-            if data:
-                 logging.info(f"Firecrawl success for URL: {url}")
-                 return data
-            else:
-                 logging.warning(f"Firecrawl returned no 'data' for URL {url}. Response: {response_data}")
-                 return None
-        else:
-             # Log the original response if it wasn't a recognized format
-            logging.warning(f"Unexpected or empty Firecrawl response format for URL {url}. Response: {response}")
-            return None
+        response = _with_retries(lambda: _FIRECRAWL.extract([url], params=params), url)
+        data = _parse_extract_response(url, response)
     except Exception as e:
         logging.error(f"Error during Firecrawl API call for URL {url}: {e}", exc_info=True)
         return None
+    return _cache_extract(cache_key, validate(url, data))
+
+
+def _batch_schema(schema: Dict) -> Dict:
+    """Wraps a single-page extract schema into a 'results' array holding one entry per URL."""
+    item = dict(schema)
+    item['properties'] = {'url': {'type': 'string'}, **schema.get('properties', {})}
+    item['required'] = ['url', *schema.get('required', [])]
+    return {
+        'type': 'object',
+        'properties': {'results': {'type': 'array', 'items': item}},
+        'required': ['results'],
+    }
+
+
+def _batch_prompt(urls: List[str], prompt: str) -> str:
+    """Wraps URL-independent assessment instructions into a prompt covering several pages."""
+    url_list = "\n".join(f"- {url}" for url in urls)
+    return f'''Assess EACH of the following pages independently:
+{url_list}
+
+{prompt}
+
+Return one entry per page in "results", with "url" set to the page's URL exactly as listed above.'''
+
+
+def _split_batch_data(urls: List[str], data: Optional[Dict]) -> Dict[str, Optional[Dict]]:
+    """Demultiplexes a batched extract result back into {url: data}; missing URLs map to None."""
+    results = {url: None for url in urls}
+    items = data.get('results') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        logging.warning(f"Firecrawl batch response had no 'results' list for URLs {urls}. Data: {data}")
+        return results
+
+    items_by_url = {
+        item['url'].rstrip('/'): item
+        for item in items
+        if isinstance(item, dict) and isinstance(item.get('url'), str)
+    }
+    matched = [items_by_url.get(url.rstrip('/')) for url in urls]
+    if not any(matched) and len(items) == len(urls):
+        # No URLs echoed back at all; fall back to position. A partial match means the order
+        # can't be trusted, so unmatched URLs stay None rather than borrowing another page's result.
+        matched = [item if isinstance(item, dict) else None for item in items]
+    for url, item in zip(urls, matched):
+        if item is not None:
+            results[url] = {key: value for key, value in item.items() if key != 'url'}
+    return results
+
+
+def _call_firecrawl_extract_batch(urls: List[str], prompt: str, schema: Dict, validate: Callable[[str, Optional[Dict]], Optional[Dict]]) -> Dict[str, Optional[Dict]]:
+    """
+    Runs a single Firecrawl extract over several URLs that share a prompt and schema, then
+    splits the combined response back out per URL. Already-cached URLs are not re-sent.
+
+    Args:
+        urls: The URLs to extract from.
+        prompt: Assessment instructions that apply to every page (must not name a specific URL).
+        schema: The JSON schema for a single page's result.
+        validate: validate(url, data) returns the page's data if it has the expected shape, else
+            None. Only validated results are cached.
+
+    Returns:
+        A dictionary mapping each URL to its validated data, or None where extraction failed.
+    """
+    results = {url: None for url in urls}
+    if _FIRECRAWL is None:
+        logging.error("Firecrawl API key not found.")
+        return results
+    pending = []
+    for url in urls:
+        results[url] = _get_cached_extract(_extract_cache_key(url, prompt), url, validate)
+        if results[url] is None:
+            pending.append(url)
+    if LOCAL_LLM_MODEL:
+        for url in pending:
+            local_data = _local_llm_extract(url, prompt, schema)
+            results[url] = validate(url, local_data) if local_data is not None else None
+        pending = [url for url in pending if results[url] is None]
+    if not pending:
+        return results
+
+    label = ', '.join(pending)
+    try:
+        params = {'prompt': _batch_prompt(pending, prompt), 'schema': _batch_schema(schema)}
+        logging.info(f"Calling Firecrawl for {len(pending)} URLs in one batch")
+        response = _with_retries(lambda: _FIRECRAWL.extract(pending, params=params), label)
+        data = _parse_extract_response(label, response)
+    except Exception as e:
+        logging.error(f"Error during batched Firecrawl API call for URLs {label}: {e}", exc_info=True)
+        return results
+
+    if data is None:
+        return results
+    for url, item in _split_batch_data(pending, data).items():
+        results[url] = _cache_extract(_extract_cache_key(url, prompt), validate(url, item))
+    return results
 
 
-def get_organic_results(keyword: str, site_path: str) -> Tuple[Optional[str], pd.DataFrame, Optional[str]]:
+def get_organic_results(keyword: str, site_path: str, session: Optional[requests.Session] = None) -> Tuple[Optional[str], pd.DataFrame]:
     """
     Retrieves organic Google search results for a keyword restricted to a specific site using SerpApi.
 
     Args:
         keyword: The search keyword.
         site_path: The domain/path to restrict the search (e.g., 'bloomsthechemist.com.au').
+        session: Optional pooled session (see build_http_session). Defaults to the module's shared session.
 
     Returns:
         A tuple containing:
         - The SerpApi raw HTML file URL (or None).
         - A DataFrame with columns ['Position', 'Ranking URL', 'Snippet'] (or empty).
-        - The SerpApi raw HTML file URL again (for consistency, though redundant in tuple). Will adjust caller.
     """
     if not SERPAPI_API_KEY:
         logging.error("SerpApi API key not found.")
-        return None, pd.DataFrame(columns=['Position', 'Ranking URL', 'Snippet']), None
+        return None, pd.DataFrame(columns=['Position', 'Ranking URL', 'Snippet'])
 
     # Ensure site_path is just the domain or domain/path without protocol
-    site_path_cleaned = site_path.replace('https://', '').replace('http://', '').strip('/')
+    site_path_cleaned = _SITE_RE.sub('', site_path)
     # Replace '&' with 'and' in the keyword for the query
     query_keyword = keyword.replace('&', 'and')
     q = f"{query_keyword} site:{site_path_cleaned}"
     api_url = f'https://serpapi.com/search.json?engine=google&api_key={SERPAPI_API_KEY}&q={q}&num=10'
 
+    cache_key = f"serp:{keyword}|{site_path_cleaned}"
+    cached = _CACHE.get(cache_key)
+    if cached is not None:
+        raw_html_file, records = cached
+        logging.info(f"SerpApi cache hit for keyword: '{keyword}', site: '{site_path_cleaned}'")
+        return raw_html_file, pd.DataFrame.from_records(records, columns=['Position', 'Ranking URL', 'Snippet'])
+
     logging.info(f"Calling SerpApi for keyword: '{keyword}', site: '{site_path_cleaned}'")
     try:
-        response = requests.get(api_url, timeout=30) # Add timeout
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-        data = response.json()
+        response = (session or _SERP_SESSION).get(api_url, timeout=30, stream=True) # Add timeout
+        try:
+            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+            # Read at most one byte past the cap so oversized bodies can be detected without buffering them
+            body = response.raw.read(SERP_MAX_RESPONSE_BYTES + 1, decode_content=True)
+        finally:
+            response.close() # Release the connection back to the pool as soon as the body is read
+        if len(body) > SERP_MAX_RESPONSE_BYTES:
+            logging.error(f"SerpApi response for keyword '{keyword}' exceeded {SERP_MAX_RESPONSE_BYTES} bytes. Skipping.")
+            return None, pd.DataFrame(columns=['Position', 'Ranking URL', 'Snippet'])
+
+        data = _json_loads(body)
         search_results = data.get('organic_results', [])
         raw_html_file = data.get('search_metadata', {}).get('raw_html_file')
 
-        ranking_data = [
-            (index + 1, result.get('link'), result.get('snippet'))
-            for index, result in enumerate(search_results)
-            if result.get('link') # Ensure there's a link
-        ]
-        result_df = pd.DataFrame(ranking_data, columns=['Position', 'Ranking URL', 'Snippet'])
+        result_df = pd.json_normalize(search_results).reindex(columns=['link', 'snippet'])
+        # Position is the rank within the raw SERP list, counted before link-less results are dropped
+        result_df.insert(0, 'Position', np.arange(1, len(result_df) + 1, dtype='int32'))
+        result_df = (
+            result_df[result_df['link'].notna() & result_df['link'].ne('')] # Ensure there's a link
+            .rename(columns={'link': 'Ranking URL', 'snippet': 'Snippet'})
+            .reset_index(drop=True)
+        )
         logging.info(f"SerpApi success for keyword: '{keyword}'. Found {len(result_df)} results.")
+        _CACHE.set(cache_key, (raw_html_file, result_df.to_dict('records')), expire=CACHE_TTL)
         return raw_html_file, result_df # Return raw_html_file first as per original logic
 
     except requests.exceptions.RequestException as e:
         logging.error(f"Error during SerpApi request for keyword '{keyword}': {e}")
-        return None, pd.DataFrame(columns=['Position', 'Ranking URL', 'Snippet']), None
+        return None, pd.DataFrame(columns=['Position', 'Ranking URL', 'Snippet'])
     except Exception as e:
         logging.error(f"An unexpected error occurred in get_organic_results for keyword '{keyword}': {e}", exc_info=True)
-        return None, pd.DataFrame(columns=['Position', 'Ranking URL', 'Snippet']), None
+        return None, pd.DataFrame(columns=['Position', 'Ranking URL', 'Snippet'])
 
 
-def assess_category_page_relevance(keyword: str, url: str) -> Optional[Dict]:
+def _run_batch(func, arg_tuples: List[Tuple], max_workers: Optional[int]) -> Dict[Tuple, Any]:
+    """Runs func(*args) for each args tuple on a bounded thread pool; returns {args: result}."""
+    def jittered_call(args):
+        time.sleep(random.uniform(0, MAX_START_JITTER)) # Stagger starts so workers don't hit the API in lockstep
+        return func(*args)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers or MAX_WORKERS) as executor:
+        futures = {executor.submit(jittered_call, args): args for args in arg_tuples}
+        for future in as_completed(futures):
+            args = futures[future]
+            try:
+                results[args] = future.result()
+            except Exception as e:
+                logging.error(f"Unexpected error in {func.__name__}{args}: {e}", exc_info=True)
+                results[args] = None
+    return results
+
+
+def batch_get_organic_results(keyword_site_pairs: List[Tuple[str, str]], max_workers: Optional[int] = None) -> Dict[Tuple[str, str], Tuple]:
     """
-    Assesses the relevance of an e-commerce category page URL to a given keyword using Firecrawl.
+    Runs get_organic_results for many (keyword, site_path) pairs concurrently on a thread pool.
 
     Args:
-        keyword: The keyword/product type/topic to check relevance against.
-        url: The URL of the category page.
+        keyword_site_pairs: A list of (keyword, site_path) tuples.
+        max_workers: Thread pool size. Defaults to MAX_WORKERS (env var 'max_workers', 50).
 
     Returns:
-        A dictionary with 'Relevant' and 'Analysis' keys, or None on error/failure.
-        Example: {'Relevant': 'Closely Related', 'Analysis': '...'}
+        A dictionary mapping each (keyword, site_path) pair to its get_organic_results return value
+        (None if the call raised unexpectedly).
     """
-    class ExtractSchema(BaseModel):
-        Relevant: str # Expecting "Closely Related", "Loosely Related", or "Unrelated"
-        Analysis: str
-
-    prompt = f'''Evaluate the specificity and focus of the provided e-commerce category page ({url}) in relation to the specific product type or topic "{keyword}".
-
-Determine the degree of relevance based on these definitions:
+    return _run_batch(get_organic_results, keyword_site_pairs, max_workers)
+
+
+# --- Extraction schemas and prompt templates (constants, built once at import) ---
+# Plain JSON Schema dicts: Firecrawl only uses them as a hint for the output shape
+_CATEGORY_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'Relevant': {'type': 'string'}, # Expecting "Closely Related", "Loosely Related", or "Unrelated"
+        'Analysis': {'type': 'string'},
+    },
+    'required': ['Relevant', 'Analysis'],
+}
+
+_PRODUCT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'Relevance': {'type': 'string'}, # Expecting "Related" or "Unrelated"
+        'Analysis': {'type': 'string'},
+    },
+    'required': ['Relevance', 'Analysis'],
+}
+
+_COMBINED_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'determined_type': {'type': 'string'}, # Expecting "PLP", "PDP", "Brand Page", "Article", "Other"
+        'relevance': {'type': 'string'},       # Expecting "Closely Related", "Loosely Related", "Unrelated", "Related", "N/A"
+        'analysis': {'type': 'string'},        # Explanation
+    },
+    'required': ['determined_type', 'relevance', 'analysis'],
+}
+
+# Expected keys and allowed values for combined classification results
+_COMBINED_KEYS = frozenset({"determined_type", "relevance", "analysis"})
+_ALLOWED_TYPES = frozenset({"PLP", "PDP", "Brand Page", "Article", "Other"})
+_ALLOWED_RELEVANCE = frozenset({"Closely Related", "Loosely Related", "Unrelated", "Related", "N/A"})
+
+# str.format templates; literal braces in the JSON examples are doubled
+# Relevance definitions for category pages; URL-independent so they can be shared by a batch of pages
+_CATEGORY_DEFINITIONS_TMPL = '''Determine the degree of relevance based on these definitions:
 - "Closely Related": The page is *primarily and specifically* dedicated to "{keyword}" products. Most products listed directly match "{keyword}", and the page title/breadcrumbs reflect this specific focus.
 - "Loosely Related": The page *includes* products matching "{keyword}", but it represents a broader category containing a significant number of other, less directly related product types. The page title/breadcrumbs likely indicate this broader scope (e.g., a general 'First Aid' page containing burn items). Provide examples.
-- "Unrelated": The page does not feature products matching "{keyword}".
+- "Unrelated": The page does not feature products matching "{keyword}".'''
+
+_CATEGORY_PROMPT_TMPL = '''Evaluate the specificity and focus of the provided e-commerce category page ({url}) in relation to the specific product type or topic "{keyword}".
+
+''' + _CATEGORY_DEFINITIONS_TMPL + '''
 
 Respond ONLY with the following JSON format:
 {{"Relevant": "(Closely Related, Loosely Related, Unrelated)", "Analysis": "(Provide a concise explanation justifying your choice based on the definitions above. If 'Closely Related', confirm the page's specific focus on '{keyword}'. If 'Loosely Related', explain how it's a broader category that includes '{keyword}' alongside other product types, mentioning the page's apparent scope. If 'Unrelated', state that '{keyword}' products are absent.)"}}'''
 
-    logging.info(f"Assessing category relevance for keyword '{keyword}' on URL: {url}")
-    result = _call_firecrawl_extract(url, prompt, ExtractSchema.model_json_schema())
+# Refined prompt based on assess_product_page_relevance's goal
+_PRODUCT_PROMPT_TMPL = '''Evaluate the provided landing page ({url}) for its relevance to the specific product type or topic "{keyword}". Determine if the page content directly matches user expectations for "{keyword}" by either being the specific product type or by including "{keyword}" as a feature, component, or bundled item. Respond ONLY with JSON in the following format: {{"Relevance": "(Related/Unrelated)", "Analysis": "(Provide a brief explanation. If Related, explain why the page precisely matches the product type/topic \'{keyword}\' or how it includes \'{keyword}\' as a feature or component. If Unrelated, explain why it fails to do so, focusing on the mismatch between the query \'{keyword}\' and the content/products offered on the page.)"}}'''
+
+# Batch counterparts of the category and product prompts; URL-independent, with the output shape given by the schema
+_CATEGORY_INSTRUCTIONS_TMPL = '''Evaluate the specificity and focus of the e-commerce category page in relation to the specific product type or topic "{keyword}".
+
+''' + _CATEGORY_DEFINITIONS_TMPL + '''
+
+Set "Relevant" to one of "Closely Related", "Loosely Related", or "Unrelated", and give a concise justification based on the definitions above in "Analysis".'''
+
+_PRODUCT_INSTRUCTIONS_TMPL = '''Evaluate the landing page for its relevance to the specific product type or topic "{keyword}". Determine if the page content directly matches user expectations for "{keyword}" by either being the specific product type or by including "{keyword}" as a feature, component, or bundled item. Set "Relevance" to "Related" or "Unrelated", and give a brief explanation in "Analysis": if Related, why the page precisely matches '{keyword}' or includes it as a feature or component; if Unrelated, the mismatch between '{keyword}' and the content/products offered on the page.'''
+
+# Type classification + relevance instructions; URL-independent so they can be shared by a batch of pages
+_CLASSIFY_INSTRUCTIONS_TMPL = '''First, determine its primary type. Choose ONE from: "PLP" (Product Listing Page/Category Page), "PDP" (Product Detail Page), "Brand Page" (Page dedicated to a specific brand), "Article" (Blog post or informational content), "Other" (Homepage, contact, help, etc.).
+
+Second, evaluate the page's relevance to the keyword/topic "{keyword}".
+- If determined_type is "PLP" or "Brand Page", assess relevance as "Closely Related", "Loosely Related", or "Unrelated" based on how well the page's product selection or focus matches "{keyword}". Provide analysis.
+- If determined_type is "PDP", assess relevance strictly based on whether the product *is* the specific type "{keyword}". Use "Related" ONLY if the product is clearly identifiable as "{keyword}" (e.g., the product title or description explicitly states it's "{keyword}" or an extremely close synonym/variant, like 'Hair Styling Powder' for 'Hair Powder'). Do NOT consider products that merely serve a similar purpose or belong to the same general category as "Related". If it's not the specific product type, use "Unrelated". Provide analysis explaining the match or mismatch of the *product type* itself.
+- If determined_type is "Article" or "Other", set relevance to "N/A" and provide a brief analysis of the page's content.'''
+
+# Combined prompt asking for type classification and then relevance based on that type
+_CLASSIFY_PROMPT_TMPL = 'Analyze the content of the page at {url}. ' + _CLASSIFY_INSTRUCTIONS_TMPL + '''
+
+Respond ONLY with JSON in the following format:
+{{"determined_type": "(PLP/PDP/Brand Page/Article/Other)", "relevance": "(Closely Related/Loosely Related/Unrelated/Related/N/A)", "analysis": "(Your analysis here)"}}'''
+
+
+def _validate_category_assessment(keyword: str, url: str, result: Optional[Dict]) -> Optional[Dict]:
+    """Returns the category assessment result if it has the expected keys, else None."""
     if result and isinstance(result, dict) and 'Relevant' in result and 'Analysis' in result:
         return result
     else:
@@ -145,6 +546,35 @@ Respond ONLY with the following JSON format:
         return None # Return None if validation fails
 
 
+def _validate_product_assessment(keyword: str, url: str, result: Optional[Dict]) -> Optional[Dict]:
+    """Returns the product/page assessment result if it has the expected keys, else None."""
+    if result and isinstance(result, dict) and 'Relevance' in result and 'Analysis' in result:
+        return result
+    else:
+        logging.warning(f"Failed to assess product/page relevance or invalid format for keyword '{keyword}', URL '{url}'. Result: {result}")
+        return None # Return None if validation fails
+
+
+@_memoize
+def assess_category_page_relevance(keyword: str, url: str) -> Optional[Dict]:
+    """
+    Assesses the relevance of an e-commerce category page URL to a given keyword using Firecrawl.
+
+    Args:
+        keyword: The keyword/product type/topic to check relevance against.
+        url: The URL of the category page.
+
+    Returns:
+        A dictionary with 'Relevant' and 'Analysis' keys, or None on error/failure.
+        Example: {'Relevant': 'Closely Related', 'Analysis': '...'}
+    """
+    prompt = _CATEGORY_PROMPT_TMPL.format(url=url, keyword=keyword)
+
+    logging.info(f"Assessing category relevance for keyword '{keyword}' on URL: {url}")
+    return _call_firecrawl_extract(url, prompt, _CATEGORY_SCHEMA, functools.partial(_validate_category_assessment, keyword))
+
+
+@_memoize
 def assess_product_page_relevance(keyword: str, url: str) -> Optional[Dict]:
     """
     Assesses the relevance of a landing page URL (likely a PDP or other content page)
@@ -158,22 +588,30 @@ def assess_product_page_relevance(keyword: str, url: str) -> Optional[Dict]:
         A dictionary with 'Relevance' and 'Analysis' keys, or None on error/failure.
         Example: {'Relevance': 'Related', 'Analysis': '...'}
     """
-    class ExtractSchema(BaseModel):
-        Relevance: str # Expecting "Related" or "Unrelated"
-        Analysis: str
-
-    # Refined prompt based on function's goal
-    prompt = f'''Evaluate the provided landing page ({url}) for its relevance to the specific product type or topic "{keyword}". Determine if the page content directly matches user expectations for "{keyword}" by either being the specific product type or by including "{keyword}" as a feature, component, or bundled item. Respond ONLY with JSON in the following format: {{"Relevance": "(Related/Unrelated)", "Analysis": "(Provide a brief explanation. If Related, explain why the page precisely matches the product type/topic \'{keyword}\' or how it includes \'{keyword}\' as a feature or component. If Unrelated, explain why it fails to do so, focusing on the mismatch between the query \'{keyword}\' and the content/products offered on the page.)"}}'''
+    prompt = _PRODUCT_PROMPT_TMPL.format(url=url, keyword=keyword)
 
     logging.info(f"Assessing product/page relevance for keyword '{keyword}' on URL: {url}")
-    result = _call_firecrawl_extract(url, prompt, ExtractSchema.model_json_schema())
-    if result and isinstance(result, dict) and 'Relevance' in result and 'Analysis' in result:
-        return result
+    return _call_firecrawl_extract(url, prompt, _PRODUCT_SCHEMA, functools.partial(_validate_product_assessment, keyword))
+
+
+def _validate_classification(keyword: str, url: str, result: Optional[Dict]) -> Optional[Dict]:
+    """Returns the classification result if it has the expected structure and values, else None."""
+    # Validate the structure of the returned data
+    if result and isinstance(result, dict) and result.keys() >= _COMBINED_KEYS:
+        # Basic validation of expected values (can be expanded)
+        determined_type, relevance = result['determined_type'], result['relevance']
+        if (isinstance(determined_type, str) and isinstance(relevance, str) and # Unhashable values can't be set members
+                determined_type in _ALLOWED_TYPES and relevance in _ALLOWED_RELEVANCE):
+             return result
+        else:
+            logging.warning(f"Invalid values in classification/assessment for keyword '{keyword}', URL '{url}'. Result: {result}")
+            return None
     else:
-        logging.warning(f"Failed to assess product/page relevance or invalid format for keyword '{keyword}', URL '{url}'. Result: {result}")
-        return None # Return None if validation fails
+        logging.warning(f"Failed classification/assessment or invalid format for keyword '{keyword}', URL '{url}'. Result: {result}")
+        return None
 
 
+@_memoize
 def classify_and_assess_url(keyword: str, url: str) -> Optional[Dict]:
     """
     Uses Firecrawl to classify a URL's page type (PLP, PDP, Other) AND assess its relevance
@@ -189,38 +627,113 @@ def classify_and_assess_url(keyword: str, url: str) -> Optional[Dict]:
                  {'determined_type': 'PDP', 'relevance': 'Related', 'analysis': '...'}
                  {'determined_type': 'Other', 'relevance': 'N/A', 'analysis': 'Page is informational.'}
     """
-    class CombinedSchema(BaseModel):
-        determined_type: str # Expecting "PLP", "PDP", "Brand Page", "Article", "Other"
-        relevance: str       # Expecting "Closely Related", "Loosely Related", "Unrelated", "Related", "N/A"
-        analysis: str        # Explanation
+    prompt = _CLASSIFY_PROMPT_TMPL.format(url=url, keyword=keyword)
 
-    # Combined prompt asking for type classification and then relevance based on that type
-    prompt = f'''Analyze the content of the page at {url}. First, determine its primary type. Choose ONE from: "PLP" (Product Listing Page/Category Page), "PDP" (Product Detail Page), "Brand Page" (Page dedicated to a specific brand), "Article" (Blog post or informational content), "Other" (Homepage, contact, help, etc.).
+    logging.info(f"Classifying and assessing URL '{url}' for keyword '{keyword}'")
+    return _call_firecrawl_extract(url, prompt, _COMBINED_SCHEMA, functools.partial(_validate_classification, keyword))
 
-Second, evaluate the page's relevance to the keyword/topic "{keyword}".
-- If determined_type is "PLP" or "Brand Page", assess relevance as "Closely Related", "Loosely Related", or "Unrelated" based on how well the page's product selection or focus matches "{keyword}". Provide analysis.
-- If determined_type is "PDP", assess relevance strictly based on whether the product *is* the specific type "{keyword}". Use "Related" ONLY if the product is clearly identifiable as "{keyword}" (e.g., the product title or description explicitly states it's "{keyword}" or an extremely close synonym/variant, like 'Hair Styling Powder' for 'Hair Powder'). Do NOT consider products that merely serve a similar purpose or belong to the same general category as "Related". If it's not the specific product type, use "Unrelated". Provide analysis explaining the match or mismatch of the *product type* itself.
-- If determined_type is "Article" or "Other", set relevance to "N/A" and provide a brief analysis of the page's content.
 
-Respond ONLY with JSON in the following format:
-{{"determined_type": "(PLP/PDP/Brand Page/Article/Other)", "relevance": "(Closely Related/Loosely Related/Unrelated/Related/N/A)", "analysis": "(Your analysis here)"}}'''
+def _group_into_batches(pairs: List[Tuple[str, str]]) -> List[Tuple[str, List[str]]]:
+    """Groups (keyword, url) pairs by keyword into de-duplicated chunks of at most MAX_EXTRACT_BATCH URLs."""
+    urls_by_keyword: Dict[str, Dict[str, None]] = {}
+    for keyword, url in pairs:
+        urls_by_keyword.setdefault(keyword, {})[url] = None
+    return [
+        (keyword, list(urls)[start:start + MAX_EXTRACT_BATCH])
+        for keyword, urls in urls_by_keyword.items()
+        for start in range(0, len(urls), MAX_EXTRACT_BATCH)
+    ]
 
-    logging.info(f"Classifying and assessing URL '{url}' for keyword '{keyword}'")
-    result = _call_firecrawl_extract(url, prompt, CombinedSchema.model_json_schema())
 
-    # Validate the structure of the returned data
-    if (result and isinstance(result, dict) and
-            'determined_type' in result and
-            'relevance' in result and
-            'analysis' in result):
-        # Basic validation of expected values (can be expanded)
-        allowed_types = ["PLP", "PDP", "Brand Page", "Article", "Other"]
-        allowed_relevance = ["Closely Related", "Loosely Related", "Unrelated", "Related", "N/A"]
-        if result['determined_type'] in allowed_types and result['relevance'] in allowed_relevance:
-             return result
-        else:
-            logging.warning(f"Invalid values in classification/assessment for keyword '{keyword}', URL '{url}'. Result: {result}")
-            return None
-    else:
-        logging.warning(f"Failed classification/assessment or invalid format for keyword '{keyword}', URL '{url}'. Result: {result}")
-        return None
\ No newline at end of file
+def _assess_in_batches(keyword: str, urls: Sequence[str], prompt: str, schema: Dict, validate) -> Dict[str, Optional[Dict]]:
+    """
+    Runs one multi-URL Firecrawl extract per chunk of at most MAX_EXTRACT_BATCH URLs; each page's
+    result is checked with validate(keyword, url, result) before it is cached or returned.
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    validate_page = functools.partial(validate, keyword)
+    results = {}
+    for start in range(0, len(unique_urls), MAX_EXTRACT_BATCH):
+        chunk = unique_urls[start:start + MAX_EXTRACT_BATCH]
+        results.update(_call_firecrawl_extract_batch(chunk, prompt, schema, validate_page))
+    return results
+
+
+def batch_assess_category_page_relevance(keyword: str, urls: Sequence[str]) -> Dict[str, Optional[Dict]]:
+    """
+    Batch version of assess_category_page_relevance: assesses several category pages for one
+    keyword with one Firecrawl request per MAX_EXTRACT_BATCH URLs.
+
+    Args:
+        keyword: The keyword/product type/topic to check relevance against.
+        urls: The URLs of the category pages.
+
+    Returns:
+        A dictionary mapping each URL to its assessment dict (same format as
+        assess_category_page_relevance), or None where the assessment failed.
+    """
+    logging.info(f"Assessing category relevance for keyword '{keyword}' on {len(urls)} URL(s) in batches")
+    return _assess_in_batches(keyword, urls, _CATEGORY_INSTRUCTIONS_TMPL.format(keyword=keyword), _CATEGORY_SCHEMA, _validate_category_assessment)
+
+
+def batch_assess_product_page_relevance(keyword: str, urls: Sequence[str]) -> Dict[str, Optional[Dict]]:
+    """
+    Batch version of assess_product_page_relevance: assesses several landing pages for one
+    keyword with one Firecrawl request per MAX_EXTRACT_BATCH URLs.
+
+    Args:
+        keyword: The keyword/product type/topic to check relevance against.
+        urls: The URLs of the landing pages.
+
+    Returns:
+        A dictionary mapping each URL to its assessment dict (same format as
+        assess_product_page_relevance), or None where the assessment failed.
+    """
+    logging.info(f"Assessing product/page relevance for keyword '{keyword}' on {len(urls)} URL(s) in batches")
+    return _assess_in_batches(keyword, urls, _PRODUCT_INSTRUCTIONS_TMPL.format(keyword=keyword), _PRODUCT_SCHEMA, _validate_product_assessment)
+
+
+def batch_classify_and_assess(keyword: str, urls: Sequence[str]) -> Dict[str, Optional[Dict]]:
+    """
+    Batch version of classify_and_assess_url: classifies and assesses several URLs for one
+    keyword with one Firecrawl request per MAX_EXTRACT_BATCH URLs.
+
+    Args:
+        keyword: The keyword/topic to check relevance against.
+        urls: The URLs of the pages to analyze.
+
+    Returns:
+        A dictionary mapping each URL to its classification dict (same format as
+        classify_and_assess_url), or None where the call failed.
+    """
+    logging.info(f"Classifying and assessing {len(urls)} URL(s) for keyword '{keyword}' in batches")
+    return _assess_in_batches(keyword, urls, _CLASSIFY_INSTRUCTIONS_TMPL.format(keyword=keyword), _COMBINED_SCHEMA, _validate_classification)
+
+
+def batch_classify_and_assess_url(keyword_url_pairs: List[Tuple[str, str]], max_workers: Optional[int] = None) -> Dict[Tuple[str, str], Optional[Dict]]:
+    """
+    Classifies and assesses many (keyword, url) pairs concurrently on a thread pool. URLs sharing
+    a keyword are sent to Firecrawl together, up to MAX_EXTRACT_BATCH per request.
+
+    Args:
+        keyword_url_pairs: A list of (keyword, url) tuples.
+        max_workers: Thread pool size. Defaults to MAX_WORKERS (env var 'max_workers', 50).
+
+    Returns:
+        A dictionary mapping each (keyword, url) pair to its classification dict, or None on failure.
+    """
+    batches = [(keyword, tuple(urls)) for keyword, urls in _group_into_batches(keyword_url_pairs)]
+    batch_results = _run_batch(batch_classify_and_assess, batches, max_workers)
+
+    results_by_pair = {}
+    for (keyword, urls), results in batch_results.items():
+        for url in urls:
+            results_by_pair[(keyword, url)] = results.get(url) if results else None
+    return results_by_pair
+
+
+def cache_clear() -> None:
+    """Clears the in-process memoization of the per-URL assessment functions (the disk cache is kept)."""
+    assess_category_page_relevance.cache_clear()
+    assess_product_page_relevance.cache_clear()
+    classify_and_assess_url.cache_clear()
@@ -1,16 +1,39 @@
+import numpy as np
 import pandas as pd
 import logging
+import re
+from functools import lru_cache
 from urllib.parse import urlparse, urlunparse
 import time
+import io
+import csv
+import json
 import os
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from pathlib import Path
+
+try:
+    import orjson
+
+    def _to_json(value):
+        """Serializes a value to a compact JSON string with orjson."""
+        return orjson.dumps(value, default=str).decode('utf-8')
+except ImportError: # orjson is optional; stdlib json produces the same compact output, more slowly
+    def _to_json(value):
+        """Serializes a value to a compact JSON string with the stdlib json module."""
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
 
 # Import functions from our refactored module
 from functions import (
+    build_http_session,
     get_organic_results,
-    assess_category_page_relevance,
-    assess_product_page_relevance,
-    classify_and_assess_url # Import the new function
+    MAX_EXTRACT_BATCH,
+    batch_assess_category_page_relevance,
+    batch_assess_product_page_relevance,
+    batch_classify_and_assess
 )
 
 # Configure logging
@@ -18,30 +41,36 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 # --- Configuration ---
 TARGET_SITE = "fatshackvintage.com.au"  # Domain only
-TARGET_SITE_URL_BASE = f"https://www.{TARGET_SITE}/"
+TARGET_SITE_URL_BASE = f"https://www.{TARGET_SITE}/" # Homepage; the path lists below are built from it
 
 # Known PLP paths (adjust as needed)
 KNOWN_PLP_PATHS = [
-    f"https://www.{TARGET_SITE}/shop-by-category/",
-    f"https://www.{TARGET_SITE}/shop-all-products/",
-    f"https://www.{TARGET_SITE}/shop-all/",
-    f"https://www.{TARGET_SITE}/collections"
+    f"{TARGET_SITE_URL_BASE}shop-by-category/",
+    f"{TARGET_SITE_URL_BASE}shop-all-products/",
+    f"{TARGET_SITE_URL_BASE}shop-all/",
+    f"{TARGET_SITE_URL_BASE}collections"
 ]
 
 # Known PDP paths (adjust as needed)
 KNOWN_PDP_PATHS = [
-    f"https://www.{TARGET_SITE}/products/"
+    f"{TARGET_SITE_URL_BASE}products/"
 ]
 
 # Known Irrelevant paths (adjust as needed - ensure they end with / if they are directories)
 KNOWN_IRRELEVANT_PATHS = [
-    f"https://www.{TARGET_SITE}/articles/",
-    f"https://www.{TARGET_SITE}/help/",
-    f"https://www.{TARGET_SITE}/about-us/",
-    f"https://www.{TARGET_SITE}/contact-us/",
-    f"https://www.{TARGET_SITE}/" # Homepage
+    f"{TARGET_SITE_URL_BASE}articles/",
+    f"{TARGET_SITE_URL_BASE}help/",
+    f"{TARGET_SITE_URL_BASE}about-us/",
+    f"{TARGET_SITE_URL_BASE}contact-us/",
+    TARGET_SITE_URL_BASE # Homepage
 ]
 
+# Precompiled page-type patterns: a PLP starts with a known PLP path; a PDP starts with a known PDP path or has a /products/ segment
+_PLP_RE = re.compile("|".join(re.escape(path) for path in KNOWN_PLP_PATHS))
+_PDP_RE = re.compile(r"^(?:" + "|".join(re.escape(path) for path in KNOWN_PDP_PATHS) + r")|/products/")
+# Irrelevant paths other than the homepage, as a tuple so str.startswith tests them all in one call (the homepage only matches exactly)
+IRRELEVANT_NON_HOME_PREFIXES = tuple(path for path in KNOWN_IRRELEVANT_PATHS if path != TARGET_SITE_URL_BASE)
+
 # Load known PLPs from Bloom's data (optional, but recommended for accuracy)
 KNOWN_PLPS_CSV_PATH = ''  # Path to your CSV
 
@@ -49,11 +78,10 @@ KNOWN_PLPS_CSV_PATH = ''  # Path to your CSV
 def load_keywords_from_file(filepath):
     """Loads keywords from a file, trims whitespace, removes duplicates and empty lines."""
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            # Read lines, strip whitespace, filter out empty lines
-            keywords = [line.strip() for line in f if line.strip()]
+        # Read the whole file at once, strip whitespace, filter out empty lines
+        lines = Path(filepath).read_text(encoding='utf-8').splitlines()
         # Deduplicate while preserving order (Python 3.7+)
-        unique_keywords = list(dict.fromkeys(keywords))
+        unique_keywords = list(dict.fromkeys(keyword for keyword in map(str.strip, lines) if keyword))
         logging.info(f"Loaded {len(unique_keywords)} unique keywords from {filepath}")
         return unique_keywords
     except FileNotFoundError:
@@ -72,17 +100,86 @@ KEYWORD_LIST = KEYWORD_LIST[:25] # Avoid errors
 DELAY_BETWEEN_KEYWORDS = 2
 DELAY_BETWEEN_URL_ASSESSMENTS = 1
 
+# Max URL assessments running at once (within and across keywords)
+MAX_ASSESSMENT_WORKERS = 8
+
+# Max keywords processed at once (their starts are still spaced by DELAY_BETWEEN_KEYWORDS)
+MAX_CONCURRENT_KEYWORDS = 4
+
 # Output file base name (timestamp and .csv will be added)
 OUTPUT_FILENAME_BASE = 'outputs/category_opportunity_analysis'
 # --- End Configuration ---
 
+class RateLimiter:
+    """
+    Thread-safe limiter for API calls: at most `max_concurrent` calls run at once, and call
+    starts are spaced at least `min_interval` seconds apart (monotonic clock).
+    Use as a context manager around each call.
+    """
+    def __init__(self, min_interval, max_concurrent):
+        self.min_interval = min_interval
+        self._semaphore = threading.Semaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+        return False
+
+# Pooled HTTP session for SERP API traffic; keep-alive connections are reused across keywords
+SESSION = build_http_session(pool_connections=16, pool_maxsize=32, backoff_factor=0.5)
+atexit.register(SESSION.close)
+
+# Shared across keywords so the API sees one steady stream of assessment calls
+URL_ASSESSMENT_LIMITER = RateLimiter(DELAY_BETWEEN_URL_ASSESSMENTS, MAX_ASSESSMENT_WORKERS)
+ASSESSMENT_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_ASSESSMENT_WORKERS)
+
+def _rate_limited_call(batch_assess_fn, keyword, urls):
+    """Runs one batched assessment call under the shared rate limiter."""
+    with URL_ASSESSMENT_LIMITER:
+        return batch_assess_fn(keyword, urls)
+
+def submit_assessments(batch_assess_fn, keyword, urls):
+    """
+    Submits batch_assess_fn(keyword, chunk) for each chunk of at most MAX_EXTRACT_BATCH URLs to the
+    shared executor, so each chunk is one API call; returns {future: chunk}.
+    """
+    chunks = [urls[start:start + MAX_EXTRACT_BATCH] for start in range(0, len(urls), MAX_EXTRACT_BATCH)]
+    return {ASSESSMENT_EXECUTOR.submit(_rate_limited_call, batch_assess_fn, keyword, chunk): chunk for chunk in chunks}
+
+def iter_assessment_batches(futures):
+    """Yields each batch's [(url, result), ...] as it completes, in SERP order within the batch."""
+    for future in as_completed(futures):
+        results = future.result()
+        yield [(url, results.get(url)) for url in futures[future]]
+
+def cancel_pending(futures):
+    """Cancels any submitted assessments that have not started yet."""
+    for future in futures:
+        future.cancel()
+
+def in_url_order(assessments, urls):
+    """Re-orders assessment results (collected in completion order) to follow the SERP order of urls."""
+    return {url: assessments[url] for url in urls if url in assessments}
+
 def load_known_plps(csv_path):
-    """Loads and cleans known PLP URLs from a CSV file."""
-    known_plps = []
+    """Loads and cleans known PLP URLs from a CSV file into a frozenset for O(1) lookups."""
+    known_plps = frozenset()
     try:
-        df = pd.read_csv(csv_path, encoding='latin1')
-        # Ensure URLs are clean (no query params/fragments)
-        known_plps = df['URL'].astype(str).apply(lambda url: clean_url(url)).unique().tolist()
+        # Only the URL column is needed; reading it as strings skips type inference on the rest
+        df = pd.read_csv(csv_path, usecols=['URL'], dtype={'URL': 'string'}, encoding='latin1')
+        # Ensure URLs are clean (no query params/fragments); blank cells are dropped rather than cleaned as 'nan'
+        known_plps = frozenset(clean_url_series(df['URL']).dropna())
         logging.info(f"Loaded {len(known_plps)} known PLPs from {csv_path}")
     except FileNotFoundError:
         logging.warning(f"Known PLPs file not found at {csv_path}. Proceeding without it.")
@@ -90,10 +187,18 @@ def load_known_plps(csv_path):
         logging.error(f"Error loading known PLPs from {csv_path}: {e}")
     return known_plps
 
+# Absolute http(s) URLs that urlparse/urlunparse would return unchanged: a host, no query/fragment/params,
+# nothing urlparse strips or rejects (whitespace, '[' or ']' in the host), and not a bare root path (which clean_url drops)
+_ALREADY_CLEAN_URL_RE = re.compile(r'https?://[^/?#;\[\]\s]+(?:/[^?#;\[\]\s]*)?')
+
+@lru_cache(maxsize=4096)
 def clean_url(url):
-    """Removes query parameters and fragments from a URL."""
+    """Removes query parameters and fragments from a URL (memoized; each unique URL is parsed once)."""
     if not isinstance(url, str):
         return None
+    # Fast path: most SERP URLs are already clean, so skip the parse/rebuild round trip
+    if url.isascii() and _ALREADY_CLEAN_URL_RE.fullmatch(url) and not (url.endswith('/') and url.count('/') == 3):
+        return url
     try:
         parsed = urlparse(url)
         # Reconstruct URL without query and fragment
@@ -108,135 +213,137 @@ def clean_url(url):
         logging.warning(f"Could not parse or clean URL '{url}': {e}")
         return None
 
-def classify_url(url, known_plps_from_csv):
-    """Classifies a URL as 'Known PLP', 'Known PDP', 'Irrelevant', or 'Unknown' based on configured paths."""
-    cleaned_url = clean_url(url)
-    if not cleaned_url:
-        return 'Unknown' # Cannot classify if cleaning failed
-
-    # Check Irrelevant first
-    if any(cleaned_url.startswith(path) for path in KNOWN_IRRELEVANT_PATHS):
-         # Exact match for homepage
-        if cleaned_url == f"https://www.{TARGET_SITE}/":
-            return 'Irrelevant'
-        # Prefix match for others (ensure it's not just a prefix of a valid page)
-        if any(cleaned_url.startswith(path) and len(cleaned_url) > len(path) for path in KNOWN_IRRELEVANT_PATHS if path != f"https://www.{TARGET_SITE}/"):
-             return 'Irrelevant'
-        # Handle exact match for paths ending in /
-        if any(cleaned_url == path for path in KNOWN_IRRELEVANT_PATHS):
-             return 'Irrelevant'
-
-
-    # Check Known PLP (exact match from CSV or prefix)
-    if cleaned_url in known_plps_from_csv:
-        return 'Known PLP'
-    # Check Known PLP (prefix, excluding URLs with both /collections/ and /products/)
-    if any(cleaned_url.startswith(path) for path in KNOWN_PLP_PATHS) and \
-       not ('/collections/' in cleaned_url and '/products/' in cleaned_url):
-        return 'Known PLP'
-
-    # Check Known PDP (prefix OR contains /products/ segment)
-    if any(cleaned_url.startswith(path) for path in KNOWN_PDP_PATHS) or '/products/' in cleaned_url:
-        return 'Known PDP'
-
-    # If none of the above, classify as Unknown for AI assessment
-    return 'Unknown'
-
-def analyze_keywords(keywords, known_plps_list):
-    """Processes the list of keywords using the refined workflow."""
-    results_list = []
-
-    for keyword in keywords:
-        logging.info(f"--- Processing Keyword: '{keyword}' ---")
-        # Initialize detailed result dictionary
-        keyword_result = {
-            'Keyword': keyword,
-            'SERP_Results_Found': False,
-            'Initial_Classification': {}, # Store initial URL classifications
-            'Known_PLP_Assessment': {}, # Store relevance for Known PLPs
-            'Known_PDP_Assessment': {}, # Store relevance for Known PDPs
-            'Unknown_URL_Assessment': {}, # Store AI type/relevance for Unknowns
-            'Decision': 'Error',
-            'Justification': 'Processing failed.',
-            'SERP_Raw_HTML_URL': None # Add field for raw HTML URL
-        }
-
-        # 1. Fetch SERP Results
-        # Correctly unpack the two return values
-        serp_html_url, serp_df = get_organic_results(keyword, TARGET_SITE)
-
-        if serp_df.empty:
-            logging.warning(f"No SERP results found for keyword '{keyword}' on {TARGET_SITE}.")
-            keyword_result['Decision'] = 'No (Irrelevant)'
-            keyword_result['Justification'] = 'No organic results found for this keyword on the target site.'
-            keyword_result['SERP_Raw_HTML_URL'] = serp_html_url # Store even if no results
-            results_list.append(keyword_result)
-            time.sleep(DELAY_BETWEEN_KEYWORDS)
-            continue
-
-        keyword_result['SERP_Results_Found'] = True
-        keyword_result['SERP_Raw_HTML_URL'] = serp_html_url # Store the URL
-        logging.info(f"Found {len(serp_df)} results in SERP for '{keyword}'.")
-
-        # 2. Initial Classification
-        classified_urls = {'Known PLP': [], 'Known PDP': [], 'Irrelevant': [], 'Unknown': []}
-        for url in serp_df['Ranking URL']:
-            cleaned = clean_url(url)
-            if not cleaned: continue
-            page_type = classify_url(cleaned, known_plps_list)
-            if cleaned not in [item for sublist in classified_urls.values() for item in sublist]: # Avoid duplicates
-                 classified_urls[page_type].append(cleaned)
-
-        keyword_result['Initial_Classification'] = {k: v for k, v in classified_urls.items()} # Store counts/lists
-        logging.info(f"Initial Classification: Known PLP={len(classified_urls['Known PLP'])}, Known PDP={len(classified_urls['Known PDP'])}, Irrelevant={len(classified_urls['Irrelevant'])}, Unknown={len(classified_urls['Unknown'])}")
-
-        # --- Assessment Stages ---
-        known_plp_assessments = {}
-        known_pdp_assessments = {}
-        unknown_url_assessments = {}
-        found_closely_related_plp = False
-        best_plp_relevance = None # None -> Unrelated -> Loosely Related -> Closely Related
-        found_related_pdp = False
-
-        # 3. Prioritized Assessment (Known PLPs)
-        if classified_urls['Known PLP']:
-            logging.info(f"Assessing {len(classified_urls['Known PLP'])} Known PLP(s)...")
-            for url in classified_urls['Known PLP']:
-                time.sleep(DELAY_BETWEEN_URL_ASSESSMENTS)
-                result = assess_category_page_relevance(keyword, url)
+def clean_url_series(urls):
+    """
+    Vectorized clean_url for a pandas Series of URLs. Absolute http(s) URLs are cleaned with
+    .str operations; anything else falls back to clean_url per row.
+    """
+    # Brackets in the host (IPv6, or urlparse errors) and whitespace (urlparse strips \t\r\n) are left to clean_url
+    is_absolute = urls.str.fullmatch(r'https?://[^/?#\[\]\s]+(?:[/?#]\S*)?', na=False)
+    cleaned = (
+        urls.where(is_absolute)
+        .str.replace(r'[?#].*$', '', regex=True) # Query and fragment
+        .str.replace(r'^(https?://[^/]+/(?:[^/]*/)*[^/;]*);[^/]*$', r'\1', regex=True) # Params on the last path segment
+        .str.replace(r'^(https?://[^/]+)/$', r'\1', regex=True) # Bare root path, as clean_url drops it
+    )
+    if not is_absolute.all():
+        cleaned[~is_absolute] = urls[~is_absolute].map(clean_url)
+    return cleaned
+
+def classify_url_series(cleaned_urls, known_plps_from_csv):
+    """
+    Classifies a Series of already-cleaned URLs as 'Known PLP', 'Known PDP', 'Irrelevant', or 'Unknown'
+    based on configured paths; returns a Series of page types. known_plps_from_csv is the set returned
+    by load_known_plps.
+    """
+    # Irrelevant: exact match for the homepage, exact or prefix match for the other paths
+    irrelevant = cleaned_urls.eq(TARGET_SITE_URL_BASE) | cleaned_urls.str.startswith(IRRELEVANT_NON_HOME_PREFIXES)
+    # Known PLP: exact match from CSV, or prefix excluding URLs with both /collections/ and /products/
+    collection_product = (cleaned_urls.str.contains('/collections/', regex=False)
+                          & cleaned_urls.str.contains('/products/', regex=False))
+    known_plp = cleaned_urls.isin(known_plps_from_csv) | (cleaned_urls.str.match(_PLP_RE) & ~collection_product)
+    # Known PDP: prefix OR contains /products/ segment
+    known_pdp = cleaned_urls.str.contains(_PDP_RE)
+    # First matching rule wins; anything else is Unknown for AI assessment
+    page_types = np.select([irrelevant, known_plp, known_pdp], ['Irrelevant', 'Known PLP', 'Known PDP'], default='Unknown')
+    return pd.Series(page_types, index=cleaned_urls.index)
+
+def _new_keyword_result(keyword):
+    """Returns the initial (not yet successful) result dictionary for a keyword."""
+    return {
+        'Keyword': keyword,
+        'SERP_Results_Found': False,
+        'Initial_Classification': {}, # Store initial URL classifications
+        'Known_PLP_Assessment': {}, # Store relevance for Known PLPs
+        'Known_PDP_Assessment': {}, # Store relevance for Known PDPs
+        'Unknown_URL_Assessment': {}, # Store AI type/relevance for Unknowns
+        'Decision': 'Error',
+        'Justification': 'Processing failed.',
+        'SERP_Raw_HTML_URL': None # Add field for raw HTML URL
+    }
+
+def _process_keyword(keyword, known_plps):
+    """Runs the refined workflow for a single keyword and returns its result dictionary."""
+    logging.info(f"--- Processing Keyword: '{keyword}' ---")
+    # Initialize detailed result dictionary
+    keyword_result = _new_keyword_result(keyword)
+
+    # 1. Fetch SERP Results
+    # Correctly unpack the two return values
+    serp_html_url, serp_df = get_organic_results(keyword, TARGET_SITE, session=SESSION)
+
+    if serp_df.empty:
+        logging.warning(f"No SERP results found for keyword '{keyword}' on {TARGET_SITE}.")
+        keyword_result['Decision'] = 'No (Irrelevant)'
+        keyword_result['Justification'] = 'No organic results found for this keyword on the target site.'
+        keyword_result['SERP_Raw_HTML_URL'] = serp_html_url # Store even if no results
+        return keyword_result
+
+    keyword_result['SERP_Results_Found'] = True
+    keyword_result['SERP_Raw_HTML_URL'] = serp_html_url # Store the URL
+    logging.info(f"Found {len(serp_df)} results in SERP for '{keyword}'.")
+
+    # 2. Initial Classification
+    cleaned_urls = clean_url_series(serp_df['Ranking URL']).dropna()
+    cleaned_urls = cleaned_urls[cleaned_urls.ne('')].drop_duplicates() # Avoid duplicates
+    page_types = classify_url_series(cleaned_urls, known_plps)
+    classified_urls = {
+        page_type: cleaned_urls[page_types.eq(page_type)].tolist()
+        for page_type in ('Known PLP', 'Known PDP', 'Irrelevant', 'Unknown')
+    }
+
+    keyword_result['Initial_Classification'] = classified_urls # Store lists (not mutated after this point)
+    logging.info(f"Initial Classification: Known PLP={len(classified_urls['Known PLP'])}, Known PDP={len(classified_urls['Known PDP'])}, Irrelevant={len(classified_urls['Irrelevant'])}, Unknown={len(classified_urls['Unknown'])}")
+
+    # --- Assessment Stages ---
+    known_plp_assessments = {}
+    known_pdp_assessments = {}
+    unknown_url_assessments = {}
+    found_closely_related_plp = False
+    best_plp_relevance = None # None -> Unrelated -> Loosely Related -> Closely Related
+    found_related_pdp = False
+
+    # 3. Prioritized Assessment (Known PLPs)
+    if classified_urls['Known PLP']:
+        logging.info(f"Assessing {len(classified_urls['Known PLP'])} Known PLP(s)...")
+        futures = submit_assessments(batch_assess_category_page_relevance, keyword, classified_urls['Known PLP'])
+        for batch in iter_assessment_batches(futures):
+            # Record the whole batch (already paid for) before deciding whether to stop
+            for url, result in batch:
                 if result:
                     known_plp_assessments[url] = result
                     relevance = result.get('Relevant')
                     if relevance == 'Closely Related':
                         found_closely_related_plp = True
                         best_plp_relevance = 'Closely Related'
-                        logging.info(f"Found 'Closely Related' Known PLP: {url}. Stopping PLP assessment.")
-                        break # Found the best case
-                    elif relevance == 'Loosely Related':
+                        logging.info(f"Found 'Closely Related' Known PLP: {url}. Stopping PLP assessment after this batch (remaining batches are cancelled).")
+                    elif relevance == 'Loosely Related' and best_plp_relevance != 'Closely Related':
                         best_plp_relevance = 'Loosely Related'
                     elif best_plp_relevance is None: # Only set to Unrelated if nothing better found yet
                         best_plp_relevance = 'Unrelated'
                 else:
                     known_plp_assessments[url] = {'Relevant': 'Assessment Failed', 'Analysis': 'API call failed.'}
                     if best_plp_relevance is None: best_plp_relevance = 'Unrelated'
-            keyword_result['Known_PLP_Assessment'] = known_plp_assessments
             if found_closely_related_plp:
-                 keyword_result['Decision'] = 'No (Existing page sufficient)'
-                 keyword_result['Justification'] = "A 'Closely Related' Known PLP was found in SERP."
-                 results_list.append(keyword_result)
-                 logging.info(f"Decision for '{keyword}': {keyword_result['Decision']}")
-                 time.sleep(DELAY_BETWEEN_KEYWORDS)
-                 continue # Move to next keyword
-
-        # 4. AI Assessment (Unknown URLs) - Only if no Closely Related Known PLP found
-        ai_identified_plps = {} # Store AI results for URLs classified as PLP
-        ai_identified_pdps = {} # Store AI results for URLs classified as PDP
-
-        if classified_urls['Unknown']:
-            logging.info(f"Assessing {len(classified_urls['Unknown'])} Unknown URL(s)...")
-            for url in classified_urls['Unknown']:
-                time.sleep(DELAY_BETWEEN_URL_ASSESSMENTS)
-                result = classify_and_assess_url(keyword, url) # Use the new combined function
+                cancel_pending(futures)
+                break # Found the best case
+        keyword_result['Known_PLP_Assessment'] = in_url_order(known_plp_assessments, classified_urls['Known PLP'])
+        if found_closely_related_plp:
+             keyword_result['Decision'] = 'No (Existing page sufficient)'
+             keyword_result['Justification'] = "A 'Closely Related' Known PLP was found in SERP."
+             logging.info(f"Decision for '{keyword}': {keyword_result['Decision']}")
+             return keyword_result
+
+    # 4. AI Assessment (Unknown URLs) - Only if no Closely Related Known PLP found
+    ai_identified_plps = {} # Store AI results for URLs classified as PLP
+    ai_identified_pdps = {} # Store AI results for URLs classified as PDP
+
+    if classified_urls['Unknown']:
+        logging.info(f"Assessing {len(classified_urls['Unknown'])} Unknown URL(s)...")
+        futures = submit_assessments(batch_classify_and_assess, keyword, classified_urls['Unknown']) # Use the combined classify + assess call
+        for batch in iter_assessment_batches(futures):
+            # Record the whole batch (already paid for) before deciding whether to stop
+            for url, result in batch:
                 if result:
                     unknown_url_assessments[url] = result
                     determined_type = result.get('determined_type')
@@ -249,8 +356,7 @@ def analyze_keywords(keywords, known_plps_list):
                              # This becomes the best PLP if no Known PLP was Closely Related
                             best_plp_relevance = 'Closely Related'
                             found_closely_related_plp = True # Mark this for decision logic
-                            logging.info(f"AI identified 'Closely Related' PLP/Brand Page: {url}. Stopping Unknown URL assessment.")
-                            break # Stop assessing unknown URLs now
+                            logging.info(f"AI identified 'Closely Related' PLP/Brand Page: {url}. Stopping Unknown URL assessment after this batch (remaining batches are cancelled).")
                         elif relevance == 'Loosely Related' and best_plp_relevance != 'Closely Related':
                             best_plp_relevance = 'Loosely Related'
                         elif relevance == 'Unrelated' and best_plp_relevance is None:
@@ -265,22 +371,23 @@ def analyze_keywords(keywords, known_plps_list):
 
                 else:
                      unknown_url_assessments[url] = {'determined_type': 'Error', 'relevance': 'Error', 'analysis': 'API call failed.'}
-            keyword_result['Unknown_URL_Assessment'] = unknown_url_assessments
-            # Re-check if a closely related PLP was found by AI
             if found_closely_related_plp:
-                 keyword_result['Decision'] = 'No (Existing page sufficient)'
-                 keyword_result['Justification'] = "AI identified a 'Closely Related' PLP or Brand Page in SERP."
-                 results_list.append(keyword_result)
-                 logging.info(f"Decision for '{keyword}': {keyword_result['Decision']}")
-                 time.sleep(DELAY_BETWEEN_KEYWORDS)
-                 continue # Move to next keyword
-
-        # 5. Assessment (Known PDPs) - Only if no Closely Related PLP found yet
-        if classified_urls['Known PDP']:
-             logging.info(f"Assessing {len(classified_urls['Known PDP'])} Known PDP(s)...")
-             for url in classified_urls['Known PDP']:
-                 time.sleep(DELAY_BETWEEN_URL_ASSESSMENTS)
-                 result = assess_product_page_relevance(keyword, url)
+                cancel_pending(futures)
+                break # Stop assessing unknown URLs now
+        keyword_result['Unknown_URL_Assessment'] = in_url_order(unknown_url_assessments, classified_urls['Unknown'])
+        # Re-check if a closely related PLP was found by AI
+        if found_closely_related_plp:
+             keyword_result['Decision'] = 'No (Existing page sufficient)'
+             keyword_result['Justification'] = "AI identified a 'Closely Related' PLP or Brand Page in SERP."
+             logging.info(f"Decision for '{keyword}': {keyword_result['Decision']}")
+             return keyword_result
+
+    # 5. Assessment (Known PDPs) - Only if no Closely Related PLP found yet
+    if classified_urls['Known PDP']:
+         logging.info(f"Assessing {len(classified_urls['Known PDP'])} Known PDP(s)...")
+         futures = submit_assessments(batch_assess_product_page_relevance, keyword, classified_urls['Known PDP'])
+         for batch in iter_assessment_batches(futures):
+             for url, result in batch:
                  if result:
                      known_pdp_assessments[url] = result
                      if result.get('Relevance') == 'Related':
@@ -288,42 +395,58 @@ def analyze_keywords(keywords, known_plps_list):
                          logging.info(f"Found 'Related' Known PDP: {url}")
                  else:
                      known_pdp_assessments[url] = {'Relevance': 'Assessment Failed', 'Analysis': 'API call failed.'}
-             keyword_result['Known_PDP_Assessment'] = known_pdp_assessments
-
-        # 6. Final Decision Logic (Synthesizing) - Only runs if no Closely Related PLP was found
-        logging.info(f"Synthesizing decision for '{keyword}': Best PLP Relevance='{best_plp_relevance}', Found Related PDP='{found_related_pdp}'")
-        if best_plp_relevance == 'Loosely Related':
-            if found_related_pdp:
-                keyword_result['Decision'] = 'Yes (Create *specific* category)'
-                keyword_result['Justification'] = "Found 'Loosely Related' PLP and 'Related' products/pages, suggesting a more specific category is needed."
-            else:
-                keyword_result['Decision'] = 'No (Loose PLP is best for now)'
-                keyword_result['Justification'] = "Found 'Loosely Related' PLP, but no specific 'Related' products/pages found to justify a new category."
-        elif best_plp_relevance == 'Unrelated' or best_plp_relevance is None:
-             if found_related_pdp:
-                keyword_result['Decision'] = 'Yes (Create *new* category)'
-                keyword_result['Justification'] = "No relevant PLP found, but 'Related' products/pages exist, justifying a new category."
-             else:
-                keyword_result['Decision'] = 'No (No relevant products/pages)'
-                keyword_result['Justification'] = 'No relevant PLPs or other pages related to the keyword were found.'
-        else: # Should not happen if closely_related check worked
-             keyword_result['Decision'] = 'Error'
-             keyword_result['Justification'] = 'Unhandled case in final decision logic.'
-             logging.error(f"Unhandled final decision logic case for keyword '{keyword}'")
-
-        results_list.append(keyword_result)
-        logging.info(f"Decision for '{keyword}': {keyword_result['Decision']}")
-        logging.info(f"Waiting {DELAY_BETWEEN_KEYWORDS}s before next keyword...")
-        time.sleep(DELAY_BETWEEN_KEYWORDS)
+         keyword_result['Known_PDP_Assessment'] = in_url_order(known_pdp_assessments, classified_urls['Known PDP'])
+
+    # 6. Final Decision Logic (Synthesizing) - Only runs if no Closely Related PLP was found
+    logging.info(f"Synthesizing decision for '{keyword}': Best PLP Relevance='{best_plp_relevance}', Found Related PDP='{found_related_pdp}'")
+    if best_plp_relevance == 'Loosely Related':
+        if found_related_pdp:
+            keyword_result['Decision'] = 'Yes (Create *specific* category)'
+            keyword_result['Justification'] = "Found 'Loosely Related' PLP and 'Related' products/pages, suggesting a more specific category is needed."
+        else:
+            keyword_result['Decision'] = 'No (Loose PLP is best for now)'
+            keyword_result['Justification'] = "Found 'Loosely Related' PLP, but no specific 'Related' products/pages found to justify a new category."
+    elif best_plp_relevance == 'Unrelated' or best_plp_relevance is None:
+         if found_related_pdp:
+            keyword_result['Decision'] = 'Yes (Create *new* category)'
+            keyword_result['Justification'] = "No relevant PLP found, but 'Related' products/pages exist, justifying a new category."
+         else:
+            keyword_result['Decision'] = 'No (No relevant products/pages)'
+            keyword_result['Justification'] = 'No relevant PLPs or other pages related to the keyword were found.'
+    else: # Should not happen if closely_related check worked
+         keyword_result['Decision'] = 'Error'
+         keyword_result['Justification'] = 'Unhandled case in final decision logic.'
+         logging.error(f"Unhandled final decision logic case for keyword '{keyword}'")
+
+    logging.info(f"Decision for '{keyword}': {keyword_result['Decision']}")
+    return keyword_result
+
+def analyze_keywords(keywords, known_plps):
+    """Processes the list of keywords using the refined workflow; returns one result dict per keyword, in keyword order."""
+    known_plps = frozenset(known_plps) # No-op for the frozenset from load_known_plps
+    limiter = RateLimiter(DELAY_BETWEEN_KEYWORDS, MAX_CONCURRENT_KEYWORDS)
+
+    def run(keyword):
+        try:
+            with limiter:
+                return _process_keyword(keyword, known_plps)
+        except Exception as e:
+            # One failed keyword shouldn't discard the results of the others
+            logging.error(f"Processing failed for keyword '{keyword}': {e}", exc_info=True)
+            keyword_result = _new_keyword_result(keyword)
+            keyword_result['Justification'] = f"Processing failed: {e}"
+            return keyword_result
+
+    # map returns results in keyword order, whatever order they finish in
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_KEYWORDS) as executor:
+        results_list = list(executor.map(run, keywords))
 
     logging.info("--- Keyword Processing Complete ---")
-    return pd.DataFrame(results_list)
+    return results_list
 
-def save_results(df, output_base_path):
-    """Saves the results DataFrame to a CSV file with a timestamp."""
+def save_results(results, output_base_path, timestamp):
+    """Saves the list of result dicts to a CSV file named with the run timestamp."""
     try:
-        # Generate timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         full_output_path = f"{output_base_path}_{timestamp}.csv"
 
         # Create outputs directory if it doesn't exist
@@ -339,124 +462,116 @@ def save_results(df, output_base_path):
             'Known_PDP_Assessment',
             'Unknown_URL_Assessment'
         ]
-        # Ensure all expected columns exist in the DataFrame, add if missing (e.g., if script failed early)
-        for col in output_columns:
-            if col not in df.columns:
-                df[col] = None # Add missing column with None values
-        export_df = df[output_columns].copy()
-
-        # Convert complex columns to strings for CSV
-        # Convert complex columns (dicts) to strings for CSV compatibility
-        # Also convert SERP_Raw_HTML_URL if it exists
-        complex_cols = ['Initial_Classification', 'Known_PLP_Assessment', 'Known_PDP_Assessment', 'Unknown_URL_Assessment', 'SERP_Raw_HTML_URL']
-        for col in complex_cols:
-             if col in export_df.columns: # Check if column exists before conversion
-                # Use fillna('') before astype(str) to handle potential None values gracefully
-                export_df[col] = export_df[col].fillna('').astype(str)
-
-        export_df.to_csv(full_output_path, index=False)
+        # Dict columns are written as JSON so they can be parsed back; missing columns (e.g., if script failed early) are left blank
+        json_cols = ['Initial_Classification', 'Known_PLP_Assessment', 'Known_PDP_Assessment', 'Unknown_URL_Assessment']
+
+        # Stream rows straight to the file in one pass
+        with open(full_output_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=output_columns, extrasaction='ignore', lineterminator='\n')
+            writer.writeheader()
+            for result in results:
+                row = dict(result) # Leave the caller's result dicts untouched
+                for col in json_cols:
+                    value = row.get(col)
+                    row[col] = _to_json(value) if value is not None else ''
+                writer.writerow(row)
         logging.info(f"Results successfully saved to {full_output_path}")
     except Exception as e:
         logging.error(f"Failed to save results to CSV at {full_output_path}: {e}")
 
 
-def generate_markdown_report(df, output_base_path):
+def generate_markdown_report(results, output_base_path, timestamp):
     """Generates a Markdown report summarizing the analysis results based on the refined workflow."""
     try:
-        # Generate timestamp (same as CSV for consistency)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        report_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Reuse the run timestamp so the report header and file name match the CSV
+        report_timestamp = datetime.strptime(timestamp, "%Y%m%d_%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
         full_output_path = f"{output_base_path}_{timestamp}.md"
 
         # Create outputs directory if it doesn't exist
         os.makedirs(os.path.dirname(full_output_path), exist_ok=True)
 
-        md_content = []
-        md_content.append(f"# Category Opportunity Analysis Report ({report_timestamp})\n")
+        buf = io.StringIO()
+        print(f"# Category Opportunity Analysis Report ({report_timestamp})\n", file=buf)
 
         # --- Summary Section ---
-        md_content.append("## Summary: Opportunities Identified\n")
-        # Ensure 'Decision' column exists before filtering
-        if 'Decision' in df.columns:
-            opportunities = df[df['Decision'].str.startswith('Yes', na=False)]
-            if not opportunities.empty:
-                for _, row in opportunities.iterrows():
-                    # Check if 'Keyword' and 'Justification' exist
-                    keyword = row.get('Keyword', 'N/A')
-                    decision = row.get('Decision', 'N/A')
-                    justification = row.get('Justification', 'N/A')
-                    md_content.append(f"*   **{keyword}**: {decision} - Justification: {justification}")
-            else:
-                md_content.append("*   No immediate opportunities for new category pages were identified based on this analysis.")
+        print("## Summary: Opportunities Identified\n", file=buf)
+        opportunities = [row for row in results if isinstance(row.get('Decision'), str) and row['Decision'].startswith('Yes')]
+        if opportunities:
+            for row in opportunities:
+                # Check if 'Keyword' and 'Justification' exist
+                keyword = row.get('Keyword', 'N/A')
+                decision = row['Decision']
+                justification = row.get('Justification', 'N/A')
+                print(f"*   **{keyword}**: {decision} - Justification: {justification}", file=buf)
         else:
-             md_content.append("*   'Decision' column not found in results, cannot generate summary.")
+            print("*   No immediate opportunities for new category pages were identified based on this analysis.", file=buf)
 
-        md_content.append("\n---\n")
+        print("\n---\n", file=buf)
 
         # --- Detailed Analysis Section ---
-        md_content.append("## Detailed Analysis by Keyword\n")
-        for index, row in df.iterrows():
+        print("## Detailed Analysis by Keyword\n", file=buf)
+        for row in results:
             keyword = row.get('Keyword', 'N/A')
             decision = row.get('Decision', 'N/A')
             justification = row.get('Justification', 'N/A')
             serp_found = row.get('SERP_Results_Found', False)
             serp_html_url = row.get('SERP_Raw_HTML_URL', 'N/A') # Get the HTML URL
 
-            md_content.append(f"### Keyword: \"{keyword}\"\n")
-            md_content.append(f"*   **Final Decision:** {decision}")
-            md_content.append(f"*   **Justification:** {justification}")
-            md_content.append(f"*   **SERP Results:** {'Found' if serp_found else 'Not Found'}")
-            md_content.append(f"*   **SERP Raw HTML:** {serp_html_url if serp_html_url else 'N/A'}") # Add HTML URL to report
+            print(f"### Keyword: \"{keyword}\"\n", file=buf)
+            print(f"*   **Final Decision:** {decision}", file=buf)
+            print(f"*   **Justification:** {justification}", file=buf)
+            print(f"*   **SERP Results:** {'Found' if serp_found else 'Not Found'}", file=buf)
+            print(f"*   **SERP Raw HTML:** {serp_html_url if serp_html_url else 'N/A'}", file=buf) # Add HTML URL to report
 
             # Initial Classification Counts (if available)
             initial_class = row.get('Initial_Classification', {})
             if isinstance(initial_class, dict):
-                 md_content.append(f"*   **Initial URL Classification:** "
-                                   f"Known PLP: {len(initial_class.get('Known PLP', []))}, "
-                                   f"Known PDP: {len(initial_class.get('Known PDP', []))}, "
-                                   f"Irrelevant: {len(initial_class.get('Irrelevant', []))}, "
-                                   f"Unknown: {len(initial_class.get('Unknown', []))}")
+                 print(f"*   **Initial URL Classification:** "
+                       f"Known PLP: {len(initial_class.get('Known PLP', []))}, "
+                       f"Known PDP: {len(initial_class.get('Known PDP', []))}, "
+                       f"Irrelevant: {len(initial_class.get('Irrelevant', []))}, "
+                       f"Unknown: {len(initial_class.get('Unknown', []))}", file=buf)
 
             # Known PLP Assessment
-            md_content.append("*   **Known PLP Assessment:**")
+            print("*   **Known PLP Assessment:**", file=buf)
             known_plp_scores = row.get('Known_PLP_Assessment', {})
             if isinstance(known_plp_scores, dict) and known_plp_scores:
                 for url, score_data in known_plp_scores.items():
-                    md_content.append(f"    *   `{url}`")
-                    md_content.append(f"        *   Relevance: `{score_data.get('Relevant', 'N/A')}`")
-                    md_content.append(f"        *   Analysis: `{score_data.get('Analysis', 'N/A')}`")
+                    print(f"    *   `{url}`", file=buf)
+                    print(f"        *   Relevance: `{score_data.get('Relevant', 'N/A')}`", file=buf)
+                    print(f"        *   Analysis: `{score_data.get('Analysis', 'N/A')}`", file=buf)
             else:
-                md_content.append("    *   None assessed or found.")
+                print("    *   None assessed or found.", file=buf)
 
             # Known PDP Assessment
-            md_content.append("*   **Known PDP Assessment:**")
+            print("*   **Known PDP Assessment:**", file=buf)
             known_pdp_scores = row.get('Known_PDP_Assessment', {})
             if isinstance(known_pdp_scores, dict) and known_pdp_scores:
                  for url, score_data in known_pdp_scores.items():
-                    md_content.append(f"    *   `{url}`")
-                    md_content.append(f"        *   Relevance: `{score_data.get('Relevance', 'N/A')}`")
-                    md_content.append(f"        *   Analysis: `{score_data.get('Analysis', 'N/A')}`")
+                    print(f"    *   `{url}`", file=buf)
+                    print(f"        *   Relevance: `{score_data.get('Relevance', 'N/A')}`", file=buf)
+                    print(f"        *   Analysis: `{score_data.get('Analysis', 'N/A')}`", file=buf)
             else:
-                md_content.append("    *   None assessed or found.")
+                print("    *   None assessed or found.", file=buf)
 
             # Unknown URL Assessment (AI Classification & Relevance)
-            md_content.append("*   **Unknown URL Assessment (AI):**")
+            print("*   **Unknown URL Assessment (AI):**", file=buf)
             unknown_scores = row.get('Unknown_URL_Assessment', {})
             if isinstance(unknown_scores, dict) and unknown_scores:
                  for url, score_data in unknown_scores.items():
-                    md_content.append(f"    *   `{url}`")
-                    md_content.append(f"        *   AI Determined Type: `{score_data.get('determined_type', 'N/A')}`")
-                    md_content.append(f"        *   Relevance: `{score_data.get('relevance', 'N/A')}`")
-                    md_content.append(f"        *   Analysis: `{score_data.get('analysis', 'N/A')}`")
+                    print(f"    *   `{url}`", file=buf)
+                    print(f"        *   AI Determined Type: `{score_data.get('determined_type', 'N/A')}`", file=buf)
+                    print(f"        *   Relevance: `{score_data.get('relevance', 'N/A')}`", file=buf)
+                    print(f"        *   Analysis: `{score_data.get('analysis', 'N/A')}`", file=buf)
             else:
-                md_content.append("    *   None assessed or found.")
+                print("    *   None assessed or found.", file=buf)
 
 
-            md_content.append("\n---\n") # Separator between keywords
+            print("\n---\n", file=buf) # Separator between keywords
 
         # Write to file
         with open(full_output_path, 'w', encoding='utf-8') as f:
-            f.write("\n".join(md_content))
+            f.write(buf.getvalue())
         logging.info(f"Markdown report successfully saved to {full_output_path}")
 
     except Exception as e:
@@ -467,10 +582,10 @@ if __name__ == "__main__":
     logging.info("Starting Category Opportunity Analyzer...")
 
     # Load known PLPs
-    known_plps_list = load_known_plps(KNOWN_PLPS_CSV_PATH)
+    known_plps = load_known_plps(KNOWN_PLPS_CSV_PATH)
 
     # Analyze keywords
-    final_df = analyze_keywords(KEYWORD_LIST, known_plps_list)
+    results = analyze_keywords(KEYWORD_LIST, known_plps)
 
     # Display results
     logging.info("--- Final Results ---")
@@ -481,13 +596,15 @@ if __name__ == "__main__":
     print_columns = [
         'Keyword', 'Decision', 'Justification', 'SERP_Results_Found'
     ]
-    # Filter final_df to only include existing columns from print_columns
+    # Build a DataFrame only for the console printout, filtered to existing columns from print_columns
+    final_df = pd.DataFrame(results)
     print_df = final_df[[col for col in print_columns if col in final_df.columns]]
     print(print_df)
 
 
-    # Save results (CSV and Markdown)
-    save_results(final_df, OUTPUT_FILENAME_BASE)
-    generate_markdown_report(final_df, OUTPUT_FILENAME_BASE)
+    # Save results (CSV and Markdown) under a single run timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    save_results(results, OUTPUT_FILENAME_BASE, timestamp)
+    generate_markdown_report(results, OUTPUT_FILENAME_BASE, timestamp)
 
     logging.info("Analysis complete.")
\ No newline at end of file